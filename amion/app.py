@@ -3,45 +3,69 @@
 
 from __future__ import annotations
 
+import hashlib
+import hmac
+import json
+import numpy as np
+import os
 import pandas as pd
 import re
 import requests
+import secrets
 import sys
+import time
 
 from datetime import datetime
 from collections import Counter
-from io import StringIO
-from urllib.request import urlretrieve, Request, urlopen
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.request import urlretrieve
 from urllib.parse import quote
 from shiny import App, reactive, render, ui
 
-def generate_url(startdate, enddate, passkey):
-    urlstem = 'https://www.amion.com/cgi-bin/ocs?Lo={}&Rpt=625ctabs'.format(
-        passkey
-    )
+_WS_RE = re.compile(r'\s+')
+_TRAIL_AMPM_RE = re.compile(r',\s*(am|pm)\s*$', flags = re.IGNORECASE)
 
-    y, m, d = startdate.strftime('%y'), startdate.month, startdate.day
-    delta = (enddate - startdate).days
-    datestring = '&Day={}&Month={}-{}&Days={}'.format(d, m, y, delta)
+_AMION_DATE_FORMAT = '%m/%d/%Y'
+_CATEGORY_COLUMNS = ('Name', 'Assignment', 'Role', 'Type')
 
-    return urlstem + datestring
+_CACHE_MAX_AGE = 60 * 60
+# Bump whenever the cached (n_rows, df_rot, master) payload changes shape.
+_CACHE_VERSION = 3
+_CACHE_ROT_COLUMNS = ['Name', 'Rotation', 'Date_d']
 
-def fetch_table(url):
-    headers = {
-        'User-Agent': (
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) '
-            'AppleWebKit/537.36 (KHTML, like Gecko) '
-            'Chrome/120.0.0.0 Safari/537.36'
-        ),
-        'Accept': 'text/plain, */*;q=0.9',
-        'Connection': 'keep-alive',
-    }
+def generate_url(startdate, enddate, passkey):
+    return (
+        f'https://www.amion.com/cgi-bin/ocs?Lo={passkey}&Rpt=625ctabs'
+        f'&Day={startdate.day}&Month={startdate.month}-{startdate:%y}'
+        f'&Days={(enddate - startdate).days}'
+    )
 
-    req = Request(url, headers = headers)
-    with urlopen(req, timeout = 60) as resp:
-        text = resp.read().decode('utf-8', errors = 'replace')
+_HEADERS = {
+    'User-Agent': (
+        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) '
+        'AppleWebKit/537.36 (KHTML, like Gecko) '
+        'Chrome/120.0.0.0 Safari/537.36'
+    ),
+    'Accept': 'text/plain, */*;q=0.9',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+# One session for all downloads. The download thread pool only issues plain
+# GETs with no per-request cookie or auth changes, and urllib3's connection
+# pool is thread-safe, so concurrent use is deliberate. The pool holds one
+# connection per academic year (AY22-AY25), so they stay alive across Loads.
+_SESSION = requests.Session()
+_SESSION.headers.update(_HEADERS)
+_SESSION.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize = 4))
+_SESSION.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize = 4))
 
-    return StringIO(text)
+def fetch_table(url):
+    resp = _SESSION.get(url, timeout = 60, stream = True)
+    resp.raise_for_status()
+    resp.raw.decode_content = True
+    return resp
 
 def download_df(academicYear, passkey):
     if academicYear == 'AY22':
@@ -62,54 +86,67 @@ def download_df(academicYear, passkey):
 
     passkey_encoded = quote(passkey)
     url = generate_url(startdate, enddate, passkey_encoded)
-    file_like = fetch_table(url)
-
-    try:
-        df = pd.read_table(
-            file_like,
-            skiprows = 7,
-            header = None,
-            usecols = [0, 3, 6, 7, 8, 9, 15, 16],
-        )
-    except pd.errors.EmptyDataError:
-        return pd.DataFrame([])
 
-    df.columns = [
-        'Name',
-        'Assignment',
-        'Date',
-        'Start',
-        'Stop',
-        'Role',
-        'Type',
-        'Assgn',
-    ]
+    with fetch_table(url) as resp:
+        try:
+            df = pd.read_table(
+                resp.raw,
+                skiprows = 7,
+                header = None,
+                usecols = [0, 3, 6, 7, 8, 9, 15, 16],
+                names = [
+                    'Name',
+                    'Assignment',
+                    'Date',
+                    'Start',
+                    'Stop',
+                    'Role',
+                    'Type',
+                    'Assgn',
+                ],
+                dtype = 'string',
+                encoding = 'utf-8',
+                encoding_errors = 'replace',
+                engine = 'c',
+                low_memory = False,
+            )
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame([])
 
     df = df[~df.Role.isnull()]
     df = df[df.Role != 'Services']
     df = df[df.Role.str[-1] != '*']
 
-    df['Name'] = (
-        df['Name']
-        .astype(str)
-        .str.replace("'", '', regex = False)
-        .str.replace('"', '', regex = False)
-        .str.strip()
+    # Both columns repeat heavily; clean each distinct value once.
+    df['Name'] = _clean_categories(
+        df['Name'],
+        lambda s: (
+            s.str.replace("'", '', regex = False)
+            .str.replace('"', '', regex = False)
+            .str.strip()
+        )
     )
 
-    df['Assignment'] = (
-        df['Assignment']
-        .astype(str)
-        .str.strip()
-        .str.replace(r'\s+', ' ', regex = True)
+    df['Assignment'] = _clean_categories(
+        df['Assignment'],
+        lambda s: s.str.strip().str.replace(_WS_RE, ' ', regex = True)
     )
 
+    for c in _CATEGORY_COLUMNS:
+        df[c] = df[c].astype('category')
+
     return df
 
 def download_df_multi_year(academicYears, passkey):
+    # Pyodide (Shinylive) cannot start threads; fetch in sequence there.
+    if sys.platform == 'emscripten' or len(academicYears) < 2:
+        results = [download_df(ay, passkey) for ay in academicYears]
+    else:
+        with ThreadPoolExecutor(max_workers = len(academicYears)) as ex:
+            results = list(ex.map(lambda ay: download_df(ay, passkey), academicYears))
+
     dfs = []
-    for ay in academicYears:
-        dfi = download_df(ay, passkey)
+    for ay, dfi in zip(academicYears, results):
         if not dfi.empty:
             dfi['AcademicYear'] = ay
             dfs.append(dfi)
@@ -117,22 +154,29 @@ def download_df_multi_year(academicYears, passkey):
     if not dfs:
         return pd.DataFrame([])
 
-    return pd.concat(dfs, ignore_index = True)
+    # Categoricals with differing categories concat to object; re-cast.
+    df = pd.concat(dfs, ignore_index = True)
+    for c in _CATEGORY_COLUMNS + ('AcademicYear',):
+        df[c] = df[c].astype('category')
+
+    return df
 
-def _parse_date_column(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df['Date_dt'] = pd.to_datetime(
+def _parse_date_column(df: pd.DataFrame) -> pd.Series:
+    dates = pd.to_datetime(
         df['Date'],
         errors = 'coerce',
-        infer_datetime_format = True
+        format = _AMION_DATE_FORMAT
     )
-    return df
 
-def _clean_rotation_text(s: str) -> str:
-    s = str(s).strip()
-    s = re.sub(r'\s+', ' ', s)
-    s = re.sub(r',\s*(am|pm)\s*$', '', s, flags = re.IGNORECASE)
-    return s
+    # Anything the export's usual format missed gets a per-value retry.
+    missed = dates.isna() & df['Date'].notna()
+    if missed.any():
+        dates[missed] = pd.to_datetime(
+            df.loc[missed, 'Date'],
+            errors = 'coerce',
+            format = 'mixed'
+        )
+    return dates
 
 def _make_exclude_regex():
     banned_terms = [
@@ -142,66 +186,195 @@ def _make_exclude_regex():
         'Vacation', 'Sick', 'Interview', 'PPC', 'Shadow', 'TBD', 'Jury',
         'ACGME'
     ]
-    pattern = r'(' + r'|'.join(re.escape(t) for t in banned_terms) + r')'
+    pattern = r'(?:' + r'|'.join(re.escape(t) for t in banned_terms) + r')'
     return re.compile(pattern, flags = re.IGNORECASE)
 
 _EXCLUDE_RE = _make_exclude_regex()
 
-def _prepare_rotations_df(df: pd.DataFrame) -> pd.DataFrame:
-    df2 = df.copy()
-    df2 = _parse_date_column(df2)
-
-    df2['Rotation'] = df2['Assignment'].map(_clean_rotation_text)
-
-    df2 = df2[df2['Rotation'].notna()]
-    df2 = df2[df2['Rotation'].astype(str).str.strip() != '']
-    df2 = df2[~df2['Rotation'].str.contains(_EXCLUDE_RE, na = False)]
-
-    df2 = df2[df2['Name'].notna()]
-    df2 = df2[df2['Name'].astype(str).str.strip() != '']
+def _excluded_rotations(rotations: pd.Series) -> list[str]:
+    # Match each distinct rotation once rather than every row.
+    distinct = pd.Series(rotations.cat.categories)
+    return distinct[distinct.str.contains(_EXCLUDE_RE, na = False)].tolist()
+
+def _clean_categories(values: pd.Series, clean) -> pd.Series:
+    # Run clean once per distinct value, then remap the codes, since
+    # cleaning can merge values.
+    cat = values.astype('category')
+    cleaned = clean(pd.Series(cat.cat.categories, dtype = 'string'))
+    codes, uniques = pd.factorize(cleaned)
+    codes = np.append(codes, -1)
+    return pd.Series(
+        pd.Categorical.from_codes(codes[cat.cat.codes.to_numpy()], categories = uniques),
+        index = values.index,
+    )
 
-    df2 = df2[df2['Date_dt'].notna()]
+def _prepare_rotations_df(df: pd.DataFrame) -> pd.DataFrame:
+    rotation = _clean_categories(
+        df['Assignment'],
+        lambda s: (
+            s.str.strip()
+            .str.replace(_WS_RE, ' ', regex = True)
+            .str.replace(_TRAIL_AMPM_RE, '', regex = True)
+        )
+    )
 
-    return df2[['Name', 'Rotation', 'Date_dt']].copy()
+    name = df['Name'].astype('category')
+    dates = _parse_date_column(df)
+
+    mask = (
+        rotation.notna()
+        & (rotation != '')
+        & ~rotation.isin(_excluded_rotations(rotation))
+        & name.notna()
+        & (name.astype('string').str.strip() != '')
+        & dates.notna()
+    ).to_numpy(dtype = bool, na_value = False)
+
+    # Build from the needed columns only instead of copying the whole frame.
+    return pd.DataFrame({
+        'Name': name.values[mask],
+        'Rotation': rotation.values[mask],
+        'Date_d': dates.values[mask].astype('datetime64[D]').view('i8').astype('int32'),
+    })
+
+def _repeat_use_flags(name_codes, rot_codes, t, n_rot, min_count, window):
+    # Plain int arrays in, one flag per rotation code out.
+    flags = np.zeros(n_rot, dtype = bool)
+    n_names = int(name_codes.max()) + 1 if len(name_codes) else 0
+    group = rot_codes.astype('int64') * n_names + name_codes
+
+    # Groups with fewer than min_count events can never qualify; drop them
+    # before paying for the sort.
+    keep = np.bincount(group)[group] >= min_count
+    group, rot_codes, t = group[keep], rot_codes[keep], t[keep]
+
+    # Flat arrays sorted by (Rotation, Name, t); contiguous runs of equal
+    # group code are the Name/Rotation groups.
+    order = np.lexsort((t, group))
+    group, rot_codes, t = group[order], rot_codes[order], t[order]
+
+    # A window holds min_count events iff an event and the one
+    # min_count - 1 places before it (same group) are close enough.
+    k = min_count - 1
+    if k <= 0:
+        flags[rot_codes] = True
+        return flags
+
+    hits = (group[k:] == group[:-k]) & ((t[k:] - t[:-k]) <= window)
+    flags[rot_codes[k:][hits]] = True
+    return flags
 
 def _rotations_with_repeat_use(df_rot: pd.DataFrame, min_count = 6, window_days = 92) -> set:
-    window_ns = int(window_days * 24 * 60 * 60 * 1_000_000_000)
-    qualifying = set()
-
-    df_rot = df_rot.copy()
-    df_rot['t'] = df_rot['Date_dt'].values.astype('datetime64[ns]').astype('int64')
-    df_rot = df_rot.sort_values(['Name', 'Rotation', 't'])
-
-    for (name, rot), g in df_rot.groupby(['Name', 'Rotation'], sort = False):
-        t = g['t'].to_numpy()
-        i = 0
-        for j in range(len(t)):
-            while t[j] - t[i] > window_ns:
-                i += 1
-            if (j - i + 1) >= min_count:
-                qualifying.add(rot)
-                break
-
-    return qualifying
-
-def build_master_rotations(df: pd.DataFrame) -> list[str]:
-    df_rot = _prepare_rotations_df(df)
-    qualifying = _rotations_with_repeat_use(df_rot = df_rot, min_count = 6, window_days = 92)
-    return sorted(qualifying, key = lambda x: x.lower())
-
-def rotations_unfilled_in_month(df: pd.DataFrame, master_rotations: list[str], month_yyyy_mm: str) -> list[str]:
-    df_rot = _prepare_rotations_df(df)
+    # Name and Rotation are categorical, so their codes already give the
+    # dense int keys the kernel groups on.
+    name_codes = df_rot['Name'].cat.codes.to_numpy()
+    rotations = df_rot['Rotation'].cat.categories
+    rot_codes = df_rot['Rotation'].cat.codes.to_numpy()
+    t = df_rot['Date_d'].to_numpy()
+
+    flags = _repeat_use_flags(
+        name_codes, rot_codes, t, len(rotations), min_count, window_days
+    )
+    return set(rotations[flags])
 
-    month_start = pd.to_datetime(month_yyyy_mm + '-01')
-    month_end = month_start + pd.offsets.MonthBegin(1)
+def build_master_rotations(df_rot: pd.DataFrame) -> tuple[str, ...]:
+    qualifying = _rotations_with_repeat_use(df_rot = df_rot, min_count = 6, window_days = 92)
+    return tuple(sorted(qualifying, key = lambda x: x.lower()))
+
+def rotations_unfilled_in_month(df_rot: pd.DataFrame, master_rotations: tuple[str, ...], month_yyyy_mm: str) -> list[str]:
+    month_start = np.datetime64(month_yyyy_mm, 'M')
+    lo = month_start.astype('datetime64[D]').view('i8')
+    hi = (month_start + 1).astype('datetime64[D]').view('i8')
+
+    t = df_rot['Date_d'].to_numpy()
+    in_month = df_rot[(t >= lo) & (t < hi)]
+    filled = np.asarray(in_month['Rotation'].unique(), dtype = object)
+
+    # master_rotations is already unique and in display order.
+    in_filled = np.isin(np.asarray(master_rotations, dtype = object), filled)
+    return [r.replace('*', '') for r, f in zip(master_rotations, in_filled) if not f]
+
+def _cache_dir():
+    # Resolved per call: Path.home() raises RuntimeError when there is no
+    # home directory, and that must only disable caching.
+    return Path.home() / '.cache' / 'amion'
+
+def _cache_secret(cache_dir):
+    # Per-install random key, so cache file names cannot be used to
+    # brute-force a short passkey offline.
+    path = cache_dir / '.secret'
+    try:
+        secret = path.read_bytes()
+        if len(secret) == 32:
+            return secret
+    except FileNotFoundError:
+        pass
+
+    cache_dir.mkdir(mode = 0o700, parents = True, exist_ok = True)
+    tmp = path.with_name('.secret.{}'.format(os.getpid()))
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(secrets.token_bytes(32))
+    os.replace(tmp, path)
+    return path.read_bytes()
+
+def _cache_path(academicYears, passkey):
+    try:
+        cache_dir = _cache_dir()
+        secret = _cache_secret(cache_dir)
+    except (OSError, RuntimeError):
+        return None
+    # JSON keeps the fields apart even if the passkey contains separators.
+    key = json.dumps([_CACHE_VERSION, passkey, sorted(academicYears)])
+    digest = hmac.new(secret, key.encode(), hashlib.sha256).hexdigest()
+    return cache_dir / '{}.pkl'.format(digest)
+
+def _prune_cache(cache_dir):
+    now = time.time()
+    for p in cache_dir.glob('*.pkl'):
+        try:
+            if now - p.stat().st_mtime >= _CACHE_MAX_AGE:
+                p.unlink()
+        except OSError:
+            pass
 
-    in_month = df_rot[(df_rot['Date_dt'] >= month_start) & (df_rot['Date_dt'] < month_end)]
-    filled = set(in_month['Rotation'].dropna().unique().tolist())
+def _read_cache(path):
+    if path is None:
+        return None
 
-    unfilled = [r for r in master_rotations if r not in filled]
-    unfilled = sorted(set(unfilled), key = lambda x: x.lower())
-    unfilled = [r.replace('*', '') for r in unfilled]
-    return unfilled
+    # Pruning is housekeeping only; freshness is decided here.
+    _prune_cache(path.parent)
+    try:
+        if time.time() - path.stat().st_mtime >= _CACHE_MAX_AGE:
+            return None
+        payload = pd.read_pickle(path)
+    except Exception:
+        return None
+
+    if not (isinstance(payload, tuple) and len(payload) == 3):
+        return None
+    n_rows, df_rot, master = payload
+    if not (
+        isinstance(n_rows, int)
+        and isinstance(df_rot, pd.DataFrame)
+        and list(df_rot.columns) == _CACHE_ROT_COLUMNS
+        and isinstance(master, tuple)
+    ):
+        return None
+    return payload
+
+def _write_cache(path, obj):
+    if path is None:
+        return
+
+    tmp = path.with_suffix('.tmp')
+    try:
+        path.parent.mkdir(mode = 0o700, parents = True, exist_ok = True)
+        pd.to_pickle(obj, tmp)
+        os.replace(tmp, path)
+    except Exception:
+        # A failed cache write must not fail an otherwise good load.
+        tmp.unlink(missing_ok = True)
 
 app_ui = ui.page_fluid(
     ui.h3('Amion Rotation Openings Checker'),
@@ -216,6 +389,11 @@ app_ui = ui.page_fluid(
                 multiple = True,
             ),
             ui.input_text('month', 'Month to check (YYYY-MM)', value = '2026-02'),
+            ui.input_checkbox(
+                'refresh',
+                'Force refresh from Amion (otherwise loads reuse data cached within the last hour)',
+                value = False,
+            ),
             ui.input_action_button('load', 'Load / Refresh data'),
             ui.input_action_button('check', 'Check month'),
             width = 4
@@ -234,8 +412,8 @@ app_ui = ui.page_fluid(
 )
 
 def server(input, output, session):
-    df_state = reactive.Value(pd.DataFrame([]))
-    master_state = reactive.Value([])
+    rot_state = reactive.Value(pd.DataFrame([]))
+    master_state = reactive.Value(())
     unfilled_state = reactive.Value([])
     status_state = reactive.Value('Ready. Enter passkey and click Load / Refresh data.')
 
@@ -244,57 +422,67 @@ def server(input, output, session):
     def _load_data():
         passkey = (input.passkey() or '').strip()
         years = list(input.years() or [])
+        refresh = bool(input.refresh())
 
         if passkey == '':
             status_state.set('No passkey entered.')
-            df_state.set(pd.DataFrame([]))
-            master_state.set([])
+            rot_state.set(pd.DataFrame([]))
+            master_state.set(())
             unfilled_state.set([])
             return
 
         if not years:
             status_state.set('No academic years selected.')
-            df_state.set(pd.DataFrame([]))
-            master_state.set([])
+            rot_state.set(pd.DataFrame([]))
+            master_state.set(())
             unfilled_state.set([])
             return
 
         try:
-            status_state.set('Loading data from Amion...')
-            df = download_df_multi_year(years, passkey)
-
-            if df.empty:
-                status_state.set('Pulled 0 rows (or export empty).')
-                df_state.set(pd.DataFrame([]))
-                master_state.set([])
-                unfilled_state.set([])
-                return
-
-            status_state.set('Building master rotation list...')
-            master = build_master_rotations(df)
-
-            df_state.set(df)
+            cache_path = _cache_path(years, passkey)
+            cached = None if refresh else _read_cache(cache_path)
+
+            if cached is not None:
+                n_rows, df_rot, master = cached
+            else:
+                status_state.set('Loading data from Amion...')
+                df = download_df_multi_year(years, passkey)
+
+                if df.empty:
+                    status_state.set('Pulled 0 rows (or export empty).')
+                    rot_state.set(pd.DataFrame([]))
+                    master_state.set(())
+                    unfilled_state.set([])
+                    return
+
+                status_state.set('Building master rotation list...')
+                n_rows = len(df)
+                df_rot = _prepare_rotations_df(df)
+                master = build_master_rotations(df_rot)
+                _write_cache(cache_path, (n_rows, df_rot, master))
+
+            rot_state.set(df_rot)
             master_state.set(master)
             unfilled_state.set([])
 
             status_state.set(
-                'Loaded rows = {}, master rotations = {}.'.format(len(df), len(master))
+                'Loaded rows = {}, master rotations = {}.'.format(n_rows, len(master))
             )
 
         except Exception as e:
             status_state.set('Load failed (did not crash UI): {}'.format(e))
-            df_state.set(pd.DataFrame([]))
-            master_state.set([])
+            rot_state.set(pd.DataFrame([]))
+            master_state.set(())
             unfilled_state.set([])
 
     @reactive.Effect
     @reactive.event(input.check)
     def _check_month():
         month = (input.month() or '').strip()
-        df = df_state.get()
+        df_rot = rot_state.get()
         master = master_state.get()
 
-        if df.empty or not master:
+        if df_rot.empty or not master:
             status_state.set('No data/master list loaded. Click Load / Refresh data first.')
             unfilled_state.set([])
             return
@@ -305,7 +493,7 @@ def server(input, output, session):
             return
 
         try:
-            unfilled = rotations_unfilled_in_month(df, master, month)
+            unfilled = rotations_unfilled_in_month(df_rot, master, month)
             unfilled_state.set(unfilled)
             status_state.set('Computed openings for {} (n = {}).'.format(month, len(unfilled)))
         except Exception as e: